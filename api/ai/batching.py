@@ -0,0 +1,84 @@
+"""Request coalescing for LLM calls made by the receipt processing graph."""
+
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+
+
+# Set by callers that run many receipts concurrently (see graph.gather_receipts).
+# Otherwise there is nothing to coalesce with, so checks are sent immediately.
+coalescing: ContextVar[bool] = ContextVar("fraud_check_coalescing", default=False)
+
+
+class BatchFraudChecker:
+    """Coalesce concurrent fraud checks into one ``llm.abatch`` call.
+
+    While ``coalescing`` is set, submissions are buffered for up to
+    ``window`` seconds (or until ``max_batch_size`` are waiting) and then
+    dispatched together. ``abatch`` still sends one HTTP request per receipt;
+    they just run concurrently on a shared client. Each caller awaits its
+    own future, so results are fanned back to the receipt that submitted
+    them. Buffers are kept per event loop.
+    """
+
+    def __init__(
+        self,
+        llm_factory: Callable[[], Any],
+        window: float = 0.05,
+        max_batch_size: int = 16,
+    ):
+        self.llm_factory = llm_factory
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[asyncio.AbstractEventLoop, List[Tuple[str, List[BaseMessage], asyncio.Future]]] = {}
+        self._timers: Dict[asyncio.AbstractEventLoop, asyncio.TimerHandle] = {}
+        self._inflight: set = set()
+
+    async def submit(self, receipt_id: str, messages: List[BaseMessage]) -> BaseMessage:
+        """Queue a fraud check and wait for its LLM response."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        pending = self._pending.setdefault(loop, [])
+        pending.append((receipt_id, messages, future))
+
+        if len(pending) >= self.max_batch_size or not coalescing.get():
+            self._flush(loop)
+        elif len(pending) == 1:
+            self._timers[loop] = loop.call_later(self.window, self._flush, loop)
+
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Send everything buffered for ``loop`` as one batch."""
+        timer: Optional[asyncio.TimerHandle] = self._timers.pop(loop, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._pending.pop(loop, [])
+        if not batch:
+            return
+
+        task = loop.create_task(self._run(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _run(self, batch: List[Tuple[str, List[BaseMessage], asyncio.Future]]) -> None:
+        try:
+            llm = self.llm_factory()
+            responses = await llm.abatch(
+                [messages for _, messages, _ in batch],
+                return_exceptions=True,
+            )
+        except Exception as e:
+            responses = [e] * len(batch)
+
+        for (_, _, future), response in zip(batch, responses):
+            if future.done():
+                continue
+            if isinstance(response, Exception):
+                future.set_exception(response)
+            else:
+                future.set_result(response)
@@ -0,0 +1,80 @@
+"""Result caches for deterministic pipeline steps."""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import redis
+
+
+class ResultCache:
+    """Bounded in-process LRU cache with an optional shared Redis tier.
+
+    Values must be JSON-serializable. Redis errors are treated as cache
+    misses so an unavailable cache never fails a receipt.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        maxsize: int = 4096,
+        ttl: Optional[float] = None,
+        redis_url: Optional[str] = None,
+    ):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = redis.Redis.from_url(redis_url) if redis_url else None
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for ``key``, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+
+        if self._redis is None:
+            return None
+
+        try:
+            raw = self._redis.get(f"{self.namespace}:{key}")
+        except redis.RedisError:
+            return None
+        if raw is None:
+            return None
+
+        value = json.loads(raw)
+        self._remember(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store ``value`` under ``key`` in every tier."""
+        self._remember(key, value)
+
+        if self._redis is None:
+            return
+
+        try:
+            self._redis.set(
+                f"{self.namespace}:{key}",
+                json.dumps(value, default=str),
+                ex=int(self.ttl) if self.ttl else None,
+            )
+        except redis.RedisError:
+            pass
+
+    def _remember(self, key: str, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
@@ -1,9 +1,16 @@
 """LangGraph workflow for receipt processing."""
 
-from typing import Literal
+import asyncio
+import atexit
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterable, List, Literal, Tuple
 from langgraph.graph import StateGraph, END, START
 from langgraph.checkpoint.memory import MemorySaver
 
+from .batching import coalescing
+from .checkpoint import EndOfWorkflowMemorySaver, MsgspecSerializer
 from .state import ReceiptProcessingState, create_initial_state
 from .nodes import (
     load_image_node,
@@ -15,40 +22,51 @@ from .nodes import (
 )
 
 
-def route_after_extraction(state: ReceiptProcessingState) -> Literal["validate", "error"]:
-    """Route after extraction based on success/failure."""
-    if state.get("processing_status") == "failed":
-        return "error"
-    if state.get("extracted_data") is None:
-        return "error"
-    return "validate"
+# Decision points: (source node, router name, condition, destination if true, otherwise)
+ROUTES = (
+    ("extract_data", "route_after_extraction",
+     'state["processing_status"] == "failed" or state["extracted_data"] is None',
+     "error", "validate"),
+    ("validate", "route_after_validation",
+     'len(state["validation_errors"]) > 3',
+     "needs_review", "fraud_check"),
+    ("fraud_check", "route_after_fraud_check",
+     'state["fraud_score"] >= 70',
+     "flag_fraud", "finalize"),
+)
+
 
+@lru_cache(maxsize=None)
+def compile_router(name: str, condition: str, if_true: str, if_false: str):
+    """Generate a routing function with its condition and destinations inlined.
 
-def route_after_validation(state: ReceiptProcessingState) -> Literal["fraud_check", "needs_review"]:
-    """Route after validation based on error count."""
-    errors = state.get("validation_errors", [])
-    if len(errors) > 3:
-        return "needs_review"
-    return "fraud_check"
+    Every state key the conditions read is set by create_initial_state, so
+    the generated code indexes the state directly instead of calling get().
+    """
+    source = (
+        f"def {name}(state):\n"
+        f"    if {condition}:\n"
+        f"        return {if_true!r}\n"
+        f"    return {if_false!r}\n"
+    )
+    namespace = {}
+    exec(compile(source, f"<router {name}>", "exec"), namespace)
+    return namespace[name]
 
 
-def route_after_fraud_check(state: ReceiptProcessingState) -> Literal["finalize", "flag_fraud"]:
-    """Route after fraud check based on score."""
-    fraud_score = state.get("fraud_score", 0)
-    if fraud_score >= 70:
-        return "flag_fraud"
-    return "finalize"
+route_after_extraction, route_after_validation, route_after_fraud_check = (
+    compile_router(*route[1:]) for route in ROUTES
+)
 
 
 def flag_fraud_node(state: ReceiptProcessingState):
     """Handle high-fraud-score receipts."""
-    from datetime import datetime
-    
     fraud_analysis = state.get("fraud_analysis", {})
+    now_iso = datetime.now().isoformat()
     
     return {
         "processing_status": "flagged_fraud",
-        "processing_completed_at": datetime.now().isoformat(),
+        "processing_completed_at": now_iso,
         "audit_notes": [
             f"FRAUD ALERT: Score {state.get('fraud_score', 0)}/100",
             f"Risk level: {fraud_analysis.get('risk_level', 'UNKNOWN')}",
@@ -59,13 +77,12 @@ def flag_fraud_node(state: ReceiptProcessingState):
 
 def needs_review_node(state: ReceiptProcessingState):
     """Handle receipts that need manual review."""
-    from datetime import datetime
-    
     validation_errors = state.get("validation_errors", [])
+    now_iso = datetime.now().isoformat()
     
     return {
         "processing_status": "needs_review",
-        "processing_completed_at": datetime.now().isoformat(),
+        "processing_completed_at": now_iso,
         "audit_notes": [
             f"MANUAL REVIEW REQUIRED: {len(validation_errors)} validation errors",
             *[f"  - {error}" for error in validation_errors],
@@ -73,8 +90,12 @@ def needs_review_node(state: ReceiptProcessingState):
     }
 
 
-def build_receipt_processing_graph():
-    """Construct the complete LangGraph workflow."""
+def build_receipt_processing_graph(checkpoint_mode: Literal["end_of_workflow", "per_node"] = "end_of_workflow"):
+    """Construct the complete LangGraph workflow.
+
+    With checkpoint_mode="end_of_workflow" only the final state of each run
+    is checkpointed; "per_node" stores a checkpoint after every node.
+    """
     
     graph_builder = StateGraph(ReceiptProcessingState)
     
@@ -92,24 +113,13 @@ def build_receipt_processing_graph():
     graph_builder.add_edge(START, "load_image")
     graph_builder.add_edge("load_image", "extract_data")
     
-    # Conditional edges
-    graph_builder.add_conditional_edges(
-        "extract_data",
-        route_after_extraction,
-        {"validate": "validate", "error": "error"}
-    )
-    
-    graph_builder.add_conditional_edges(
-        "validate",
-        route_after_validation,
-        {"fraud_check": "fraud_check", "needs_review": "needs_review"}
-    )
-    
-    graph_builder.add_conditional_edges(
-        "fraud_check",
-        route_after_fraud_check,
-        {"finalize": "finalize", "flag_fraud": "flag_fraud"}
-    )
+    # Conditional edges (destinations given as a list, so no mapping dict)
+    for source, *router_spec in ROUTES:
+        graph_builder.add_conditional_edges(
+            source,
+            compile_router(*router_spec),
+            router_spec[-2:]
+        )
     
     # Terminal edges
     graph_builder.add_edge("finalize", END)
@@ -118,25 +128,108 @@ def build_receipt_processing_graph():
     graph_builder.add_edge("error", END)
     
     # Compile
-    memory = MemorySaver()
+    serde = MsgspecSerializer()
+    if checkpoint_mode == "per_node":
+        memory = MemorySaver(serde=serde)
+    elif checkpoint_mode == "end_of_workflow":
+        memory = EndOfWorkflowMemorySaver(serde=serde)
+    else:
+        raise ValueError(f"Unknown checkpoint mode: {checkpoint_mode}")
     return graph_builder.compile(checkpointer=memory)
 
 
+@lru_cache(maxsize=1)
+def get_pipeline():
+    """Return this process's compiled receipt processing graph, building it once."""
+    return build_receipt_processing_graph()
+
+
 # Create graph instance
-receipt_processing_graph = build_receipt_processing_graph()
+receipt_processing_graph = get_pipeline()
 
 
-def process_receipt(receipt_id: str, image_path: str, report_id: str) -> ReceiptProcessingState:
-    """Process a receipt through the AI pipeline."""
+@lru_cache(maxsize=1024)
+def _thread_config(thread_id: str) -> dict:
+    """Run config for a checkpointer thread; treat the result as read-only."""
+    return {"configurable": {"thread_id": thread_id}}
+
+
+async def aprocess_receipt(receipt_id: str, image_path: str, report_id: str, pipeline=None) -> ReceiptProcessingState:
+    """Process a receipt through the AI pipeline on the running event loop.
+
+    ``pipeline`` is a compiled graph (see get_pipeline); defaults to the
+    module-level one.
+    """
     initial_state = create_initial_state(
         receipt_id=receipt_id,
         image_path=image_path,
         report_id=report_id
     )
     
-    config = {"configurable": {"thread_id": receipt_id}}
+    pipeline = pipeline or receipt_processing_graph
+    try:
+        return await pipeline.ainvoke(initial_state, _thread_config(receipt_id))
+    except BaseException:
+        _discard_run(pipeline, receipt_id)
+        raise
+
+
+def _discard_run(pipeline, thread_id: str) -> None:
+    """Free the checkpointer's buffered state for a run that raised."""
+    discard = getattr(pipeline.checkpointer, "discard", None)
+    if discard is not None:
+        discard(thread_id)
+
+
+_runners = threading.local()
+
+
+def _get_runner() -> asyncio.Runner:
+    """Return this thread's long-lived event loop runner, creating it on first use.
+
+    Reusing one loop keeps the per-loop LLM clients (and their connection
+    pools) alive across receipts instead of rebuilding them on every call.
+    """
+    runner = getattr(_runners, "runner", None)
+    if runner is None:
+        runner = _runners.runner = asyncio.Runner()
+        atexit.register(runner.close)
+    return runner
+
+
+def process_receipt(receipt_id: str, image_path: str, report_id: str, pipeline=None) -> ReceiptProcessingState:
+    """Process a receipt through the AI pipeline."""
+    # The LLM nodes are async, so the graph must run on an event loop
+    try:
+        return _get_runner().run(aprocess_receipt(receipt_id, image_path, report_id, pipeline))
+    except BaseException:
+        # Also covers exceptions raised outside the coroutine (e.g. a soft
+        # time limit interrupting the event loop itself)
+        _discard_run(pipeline or receipt_processing_graph, receipt_id)
+        raise
+
+
+async def gather_receipts(
+    receipts: Iterable[Tuple[str, str, str]],
+    max_concurrency: int = 8,
+) -> List[ReceiptProcessingState]:
+    """Process (receipt_id, image_path, report_id) tuples concurrently.
+
+    At most ``max_concurrency`` receipts are in flight at once; results are
+    returned in input order. Their fraud checks are coalesced into batches.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def run(receipt_id: str, image_path: str, report_id: str) -> ReceiptProcessingState:
+        async with semaphore:
+            return await aprocess_receipt(receipt_id, image_path, report_id)
     
-    return receipt_processing_graph.invoke(initial_state, config)
+    # The receipt tasks copy this context when gather() creates them
+    token = coalescing.set(True)
+    try:
+        return await asyncio.gather(*(run(*receipt) for receipt in receipts))
+    finally:
+        coalescing.reset(token)
 
 
 def get_graph_visualization():
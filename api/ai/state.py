@@ -1,7 +1,9 @@
 """State definitions for the receipt processing LangGraph pipeline."""
 
+import operator
+import time
+from datetime import datetime
 from typing import TypedDict, List, Optional, Annotated
-from operator import add
 from langgraph.graph import MessagesState
 
 
@@ -46,11 +48,12 @@ class ReceiptProcessingState(TypedDict):
     report_id: str
     
     # Processing fields
-    image_base64: Optional[str]
+    image_ref: Optional[str]  # Path or URL; encoded only at LLM call time
+    image_hash: Optional[str]
     ocr_text: Optional[str]
     extracted_data: Optional[ExtractedReceiptData]
     validation_passed: Optional[bool]
-    validation_errors: Annotated[List[str], add]
+    validation_errors: Annotated[List[str], operator.add]
     
     # Fraud detection
     fraud_analysis: Optional[FraudAnalysis]
@@ -59,10 +62,11 @@ class ReceiptProcessingState(TypedDict):
     # Output fields
     processing_status: str
     error_message: Optional[str]
-    audit_notes: Annotated[List[str], add]
+    audit_notes: Annotated[List[str], operator.add]
     
     # Metadata
     processing_started_at: Optional[str]
+    processing_started_monotonic_ns: Optional[int]
     processing_completed_at: Optional[str]
     total_processing_time_ms: Optional[int]
 
@@ -73,13 +77,12 @@ def create_initial_state(
     report_id: str
 ) -> ReceiptProcessingState:
     """Create the initial state for processing a receipt."""
-    from datetime import datetime
-    
     return ReceiptProcessingState(
         receipt_id=receipt_id,
         image_path=image_path,
         report_id=report_id,
-        image_base64=None,
+        image_ref=None,
+        image_hash=None,
         ocr_text=None,
         extracted_data=None,
         validation_passed=None,
@@ -90,6 +93,7 @@ def create_initial_state(
         error_message=None,
         audit_notes=[],
         processing_started_at=datetime.now().isoformat(),
+        processing_started_monotonic_ns=time.perf_counter_ns(),
         processing_completed_at=None,
         total_processing_time_ms=None,
     )
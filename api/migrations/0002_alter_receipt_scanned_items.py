@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-15 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='receipt',
+            name='scanned_items',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.10 on 2026-10-15 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_alter_receipt_scanned_items'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expensereport',
+            index=models.Index(fields=['user', 'status', 'created_at'], name='report_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['report', 'transaction_date'], name='receipt_report_txdate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['fraud_score'], name='receipt_fraud_score_idx'),
+        ),
+    ]
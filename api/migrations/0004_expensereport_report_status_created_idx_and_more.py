@@ -0,0 +1,25 @@
+# Generated by Django 5.2.10 on 2026-10-15 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_expensereport_report_user_status_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expensereport',
+            index=models.Index(fields=['status', '-created_at'], name='report_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['report', '-created_at'], name='receipt_report_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['created_at', 'fraud_score'], name='receipt_created_fraud_idx'),
+        ),
+    ]
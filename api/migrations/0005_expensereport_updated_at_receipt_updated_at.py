@@ -0,0 +1,26 @@
+# Generated by Django 5.2.10 on 2026-10-15 11:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_expensereport_report_status_created_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expensereport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='receipt',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
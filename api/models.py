@@ -14,8 +14,15 @@ class ExpenseReport(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status', 'created_at'], name='report_user_status_idx'),
+            models.Index(fields=['status', '-created_at'], name='report_status_created_idx'),
+        ]
+
     def __str__(self):
         return f"Report {self.id} - {self.status}"
 
@@ -34,13 +41,22 @@ class Receipt(models.Model):
     tax_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     
     # Raw JSON from AI
-    scanned_items = models.JSONField(default=dict, blank=True)
+    scanned_items = models.JSONField(default=list, blank=True)
     
     # Audit Results
     fraud_score = models.IntegerField(default=0)
     audit_notes = models.TextField(blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['report', 'transaction_date'], name='receipt_report_txdate_idx'),
+            models.Index(fields=['fraud_score'], name='receipt_fraud_score_idx'),
+            models.Index(fields=['report', '-created_at'], name='receipt_report_created_idx'),
+            models.Index(fields=['created_at', 'fraud_score'], name='receipt_created_fraud_idx'),
+        ]
 
     def __str__(self):
         return f"Receipt {self.id} - {self.merchant_name or 'Unknown'}"
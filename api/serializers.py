@@ -4,6 +4,27 @@ from rest_framework import serializers
 from .models import ExpenseReport, Receipt
 
 
+MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
+
+# Leading bytes of each accepted image format
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+)
+
+
+def sniff_image_type(header):
+    """Return the MIME type for the first 12 bytes of an image, or None."""
+    for signature, content_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return content_type
+    
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    
+    return None
+
+
 class ReceiptSerializer(serializers.ModelSerializer):
     """Full serializer for Receipt model - used for reading data."""
     
@@ -70,20 +91,19 @@ class ReceiptUploadSerializer(serializers.ModelSerializer):
     
     def validate_original_image(self, value):
         """Validate uploaded image file."""
-        max_size = 10 * 1024 * 1024  # 10MB
-        
-        if value.size > max_size:
+        if value.size > MAX_IMAGE_SIZE:
             raise serializers.ValidationError(
                 "Image file too large. Maximum size is 10MB."
             )
         
-        allowed_types = ['image/jpeg', 'image/png', 'image/webp']
+        # Trust the file's magic bytes, not the client-supplied content type
+        header = value.read(12)
+        value.seek(0)
         
-        if hasattr(value, 'content_type'):
-            if value.content_type not in allowed_types:
-                raise serializers.ValidationError(
-                    f"Invalid file type: {value.content_type}. "
-                    f"Allowed types: {', '.join(allowed_types)}"
-                )
+        if sniff_image_type(header) is None:
+            raise serializers.ValidationError(
+                "Invalid file type. "
+                "Allowed types: image/jpeg, image/png, image/webp"
+            )
         
         return value
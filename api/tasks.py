@@ -1,25 +1,52 @@
 """Celery async tasks for background AI processing."""
 
-from celery import shared_task
+from celery import chord, group, shared_task
+from celery.signals import worker_process_init
 from celery.utils.log import get_task_logger
-import traceback
-from datetime import datetime
+from django.db import InterfaceError, OperationalError
+from django.utils import timezone
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
 
 logger = get_task_logger(__name__)
 
 
+@worker_process_init.connect
+def warm_pipeline(**kwargs):
+    """Build the AI pipeline when a worker child starts, not on its first task.
+    
+    Only workers started with WARM_AI_PIPELINE=1 (those consuming the 'ai'
+    queue) do this; the others never run the pipeline.
+    """
+    if os.getenv('WARM_AI_PIPELINE') != '1':
+        return
+    
+    from api.ai.graph import get_pipeline
+    
+    get_pipeline()
+    logger.info("AI pipeline ready")
+
+
+# Failures worth retrying: network, broker, storage and dropped DB connections
+TRANSIENT_ERRORS = (OSError, OperationalError, InterfaceError)
+
+
 @shared_task(
     bind=True,
     max_retries=3,
     default_retry_delay=60,
-    autoretry_for=(Exception,),
-    retry_backoff=True,
-    retry_backoff_max=600,
     soft_time_limit=300,
     time_limit=360,
 )
-def process_receipt_task(self, receipt_id: str):
-    """Process a receipt through the AI pipeline."""
+def process_receipt_task(self, receipt_id: str, return_errors: bool = False):
+    """Process a receipt through the AI pipeline.
+    
+    With return_errors=True a failure that won't be retried is returned as
+    a {'status': 'failed'} result instead of raised, so a batch chord still
+    reaches its callback.
+    """
     
     logger.info(f"Starting receipt processing: {receipt_id}")
     
@@ -32,13 +59,17 @@ def process_receipt_task(self, receipt_id: str):
         # Load receipt from database
         from api.models import Receipt, ExpenseReport
         
-        try:
-            receipt = Receipt.objects.get(id=receipt_id)
-        except Receipt.DoesNotExist:
+        # Only the columns the pipeline needs; no model instance is built
+        receipt = Receipt.objects.filter(id=receipt_id).values('original_image', 'report_id').first()
+        
+        if receipt is None:
             logger.error(f"Receipt not found: {receipt_id}")
             return {'status': 'failed', 'error': f'Receipt {receipt_id} not found'}
         
-        logger.info(f"Loaded receipt: {receipt.id}, Image: {receipt.original_image.name}")
+        report_id = receipt['report_id']
+        image_storage = Receipt._meta.get_field('original_image').storage
+        
+        logger.info(f"Loaded receipt: {receipt_id}, Image: {receipt['original_image']}")
         
         # Update progress
         self.update_state(
@@ -47,12 +78,13 @@ def process_receipt_task(self, receipt_id: str):
         )
         
         # Run the LangGraph pipeline
-        from api.ai.graph import process_receipt
+        from api.ai.graph import get_pipeline, process_receipt
         
         result = process_receipt(
-            receipt_id=str(receipt.id),
-            image_path=receipt.original_image.path,
-            report_id=str(receipt.report_id)
+            receipt_id=str(receipt_id),
+            image_path=image_storage.path(receipt['original_image']),
+            report_id=str(report_id),
+            pipeline=get_pipeline()
         )
         
         logger.info(f"AI pipeline complete, Status: {result.get('processing_status')}")
@@ -66,33 +98,38 @@ def process_receipt_task(self, receipt_id: str):
         # Save results to database
         extracted = result.get('extracted_data', {})
         
+        updates = {
+            'fraud_score': result.get('fraud_score', 0),
+            'audit_notes': '\n'.join(result.get('audit_notes', [])),
+            'updated_at': timezone.now(),
+        }
+        
         if extracted:
-            receipt.merchant_name = extracted.get('merchant_name')
-            receipt.transaction_date = parse_date(extracted.get('transaction_date'))
-            receipt.total_amount = extracted.get('total_amount')
-            receipt.tax_amount = extracted.get('tax_amount')
-            receipt.scanned_items = extracted.get('items', [])
+            updates.update(
+                merchant_name=extracted.get('merchant_name'),
+                transaction_date=parse_date(extracted.get('transaction_date')),
+                total_amount=extracted.get('total_amount'),
+                tax_amount=extracted.get('tax_amount'),
+                scanned_items=extracted.get('items', []),
+            )
         
-        receipt.fraud_score = result.get('fraud_score', 0)
-        receipt.audit_notes = '\n'.join(result.get('audit_notes', []))
-        receipt.save()
+        Receipt.objects.filter(id=receipt_id).update(**updates)
         
         # Update expense report total
         if extracted and extracted.get('total_amount'):
-            update_report_total(receipt.report_id)
+            update_report_total(report_id)
         
         # Handle flagged receipts
         processing_status = result.get('processing_status', '')
         
         if processing_status in ['flagged_fraud', 'needs_review']:
-            report = ExpenseReport.objects.get(id=receipt.report_id)
-            report.status = 'FLAGGED'
-            report.save()
+            ExpenseReport.objects.filter(id=report_id).update(status='FLAGGED', updated_at=timezone.now())
             logger.warning(f"Receipt flagged: {processing_status}")
         
         return {
             'status': 'success',
             'receipt_id': receipt_id,
+            'report_id': str(report_id),
             'processing_status': processing_status,
             'fraud_score': result.get('fraud_score', 0),
             'merchant_name': extracted.get('merchant_name') if extracted else None,
@@ -101,27 +138,45 @@ def process_receipt_task(self, receipt_id: str):
         
     except Exception as e:
         logger.error(f"Task failed: {str(e)}")
-        logger.error(traceback.format_exc())
+        # The traceback is only formatted if DEBUG logging is on
+        logger.debug("Task failure traceback", exc_info=True)
         
         try:
             from api.models import Receipt
-            receipt = Receipt.objects.get(id=receipt_id)
-            receipt.audit_notes = f"Processing failed: {str(e)}"
-            receipt.save()
-        except:
+            Receipt.objects.filter(id=receipt_id).update(
+                audit_notes=f"Processing failed: {str(e)}",
+                updated_at=timezone.now()
+            )
+        except Exception:
             pass
         
+        if isinstance(e, TRANSIENT_ERRORS) and self.request.retries < self.max_retries:
+            # Exponential backoff: 60s, 120s, 240s (capped at 10 minutes)
+            raise self.retry(exc=e, countdown=min(60 * 2 ** self.request.retries, 600))
+        
+        if return_errors:
+            return {'status': 'failed', 'receipt_id': receipt_id, 'error': str(e)}
+        
         raise
 
 
+# Formats tried, in order, when a date isn't zero-padded ISO (YYYY-MM-DD)
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%Y/%m/%d")
+
+
 def parse_date(date_string: str):
     """Parse date string to Python date object."""
     if not date_string:
         return None
     
-    formats = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%Y/%m/%d"]
+    # ISO dates (what the extraction prompt asks for) take the C fast path
+    if len(date_string) == 10 and date_string[4] == '-':
+        try:
+            return date.fromisoformat(date_string)
+        except ValueError:
+            return None
     
-    for fmt in formats:
+    for fmt in DATE_FORMATS:
         try:
             return datetime.strptime(date_string, fmt).date()
         except ValueError:
@@ -130,45 +185,61 @@ def parse_date(date_string: str):
     return None
 
 
-def update_report_total(report_id: str):
-    """Recalculate the total amount for an expense report."""
+def update_report_totals(report_ids) -> int:
+    """Recalculate the total amount of expense reports in a single UPDATE.
+
+    Each report's total is a correlated SUM over its receipts, computed by
+    the database, so concurrent workers can't overwrite each other with
+    stale totals. Returns the number of reports updated.
+    """
     from api.models import ExpenseReport, Receipt
-    from django.db.models import Sum
+    from django.db.models import OuterRef, Subquery, Sum, Value
+    from django.db.models.functions import Coalesce
     
-    try:
-        total = Receipt.objects.filter(
-            report_id=report_id,
-            total_amount__isnull=False
-        ).aggregate(Sum('total_amount'))['total_amount__sum']
-        
-        report = ExpenseReport.objects.get(id=report_id)
-        report.total_amount = total or 0
-        report.save()
-        
-        logger.info(f"Updated report total: ${total or 0:.2f}")
-        
-    except ExpenseReport.DoesNotExist:
+    receipts_total = Receipt.objects.filter(
+        report_id=OuterRef('id'),
+        total_amount__isnull=False
+    ).values('report_id').annotate(total=Sum('total_amount')).values('total')
+    
+    return ExpenseReport.objects.filter(id__in=report_ids).update(
+        total_amount=Coalesce(Subquery(receipts_total), Value(Decimal('0'))),
+        updated_at=timezone.now()
+    )
+
+
+def update_report_total(report_id: str):
+    """Recalculate the total amount for an expense report."""
+    if update_report_totals([report_id]):
+        logger.info(f"Updated report total: {report_id}")
+    else:
         logger.error(f"Report not found: {report_id}")
 
 
 @shared_task(bind=True)
 def batch_process_receipts_task(self, receipt_ids: list):
-    """Process multiple receipts in sequence."""
+    """Process multiple receipts in parallel across workers."""
     logger.info(f"Batch processing {len(receipt_ids)} receipts")
     
-    results = []
+    # Fan out one task per receipt; the chord callback tallies the results.
+    # Receipts return their failures instead of raising, since one raising
+    # task would fail the chord and the callback would never run
+    header = group(process_receipt_task.s(str(receipt_id), return_errors=True) for receipt_id in receipt_ids)
+    result = chord(header)(aggregate_batch_results.s(receipt_ids))
     
-    for i, receipt_id in enumerate(receipt_ids):
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': i + 1, 'total': len(receipt_ids), 'current_receipt': receipt_id}
-        )
-        
-        try:
-            result = process_receipt_task.apply(args=[receipt_id])
-            results.append({'receipt_id': receipt_id, 'status': 'success', 'result': result.get()})
-        except Exception as e:
-            results.append({'receipt_id': receipt_id, 'status': 'failed', 'error': str(e)})
+    # Never join here: callers poll the saved group with
+    # GroupResult.restore(group_id), or read the summary from batch_id
+    result.parent.save()
+    
+    return {'batch_id': result.id, 'group_id': result.parent.id, 'total': len(receipt_ids)}
+
+
+@shared_task
+def aggregate_batch_results(results: list, receipt_ids: list):
+    """Summarize the per-receipt results of a batch."""
+    results = [
+        {'receipt_id': receipt_id, 'status': result.get('status', 'failed'), 'result': result}
+        for receipt_id, result in zip(receipt_ids, results)
+    ]
     
     return {
         'total_processed': len(receipt_ids),
@@ -178,6 +249,9 @@ def batch_process_receipts_task(self, receipt_ids: list):
     }
 
 
+RESCAN_DISPATCH_CHUNK = 500
+
+
 @shared_task
 def rescan_recent_receipts_for_fraud():
     """Periodic task to re-scan recent receipts for fraud."""
@@ -189,9 +263,16 @@ def rescan_recent_receipts_for_fraud():
         fraud_score__lt=50
     ).values_list('id', flat=True)
     
-    logger.info(f"Re-scanning {len(recent)} recent receipts")
+    logger.info(f"Re-scanning {recent.count()} recent receipts")
+    
+    # Stream the ids (memory stays at one chunk) and dispatch them in
+    # groups so each chunk is published over one producer connection
+    receipt_ids_iter = recent.iterator(chunk_size=2000)
+    queued = 0
+    while receipt_ids := list(islice(receipt_ids_iter, RESCAN_DISPATCH_CHUNK)):
+        group(process_receipt_task.s(str(receipt_id)) for receipt_id in receipt_ids).apply_async()
+        queued += len(receipt_ids)
     
-    for receipt_id in recent:
-        process_receipt_task.delay(str(receipt_id))
+    logger.info(f"Queued {queued} receipts for re-scan")
     
-    return {'queued': len(recent)}
+    return {'queued': queued}
@@ -0,0 +1,134 @@
+"""Tests for the expense management API."""
+
+import asyncio
+import operator
+import os
+import tempfile
+from typing import Annotated, List, TypedDict
+from unittest import mock
+
+import orjson
+from django.test import SimpleTestCase
+from langchain_core.messages import AIMessage
+from langgraph.graph import END, START, StateGraph
+
+from .ai import nodes
+from .ai.checkpoint import EndOfWorkflowMemorySaver
+from .ai.graph import build_receipt_processing_graph
+from .ai.state import create_initial_state
+
+
+class EndOfWorkflowMemorySaverTests(SimpleTestCase):
+    """The final checkpoint must hold the whole state, not just the last node's writes."""
+
+    class State(TypedDict):
+        receipt_id: str
+        fraud_score: int
+        processing_status: str
+        audit_notes: Annotated[List[str], operator.add]
+
+    def build_graph(self):
+        builder = StateGraph(self.State)
+        builder.add_node("fraud_check", lambda state: {"fraud_score": 42, "audit_notes": ["checked"]})
+        builder.add_node("finalize", lambda state: {"processing_status": "completed", "audit_notes": ["done"]})
+        builder.add_edge(START, "fraud_check")
+        builder.add_edge("fraud_check", "finalize")
+        builder.add_edge("finalize", END)
+        return builder.compile(checkpointer=EndOfWorkflowMemorySaver())
+
+    def test_final_checkpoint_has_complete_state(self):
+        graph = self.build_graph()
+        config = {"configurable": {"thread_id": "receipt-1"}}
+
+        graph.invoke({"receipt_id": "receipt-1", "audit_notes": []}, config)
+
+        self.assertEqual(graph.get_state(config).values, {
+            "receipt_id": "receipt-1",
+            "fraud_score": 42,
+            "processing_status": "completed",
+            "audit_notes": ["checked", "done"],
+        })
+
+    def test_only_the_final_checkpoint_is_stored(self):
+        graph = self.build_graph()
+        config = {"configurable": {"thread_id": "receipt-2"}}
+
+        graph.invoke({"receipt_id": "receipt-2", "audit_notes": []}, config)
+
+        self.assertEqual(len(list(graph.get_state_history(config))), 1)
+
+    def test_rerun_on_same_thread_stores_only_its_final_checkpoint(self):
+        graph = self.build_graph()
+        config = {"configurable": {"thread_id": "receipt-3"}}
+
+        for _ in range(3):
+            graph.invoke({"receipt_id": "receipt-3", "audit_notes": []}, config)
+
+        self.assertEqual(len(list(graph.get_state_history(config))), 3)
+
+    def test_discard_drops_a_failed_run(self):
+        def fail(state):
+            raise ValueError("boom")
+
+        builder = StateGraph(self.State)
+        builder.add_node("fraud_check", fail)
+        builder.add_edge(START, "fraud_check")
+        builder.add_edge("fraud_check", END)
+        saver = EndOfWorkflowMemorySaver()
+        graph = builder.compile(checkpointer=saver)
+
+        with self.assertRaises(ValueError):
+            graph.invoke({"receipt_id": "receipt-4", "audit_notes": []},
+                         {"configurable": {"thread_id": "receipt-4"}})
+        self.assertIn(("receipt-4", ""), saver._buffer)
+
+        saver.discard("receipt-4")
+
+        self.assertEqual(saver._buffer, {})
+        self.assertEqual(saver._run_start, {})
+
+
+class ReceiptProcessingGraphTests(SimpleTestCase):
+    """Run the real graph and state, with the fraud LLM stubbed out."""
+
+    def setUp(self):
+        # Random bytes, so the extraction cache can't already hold this image
+        image = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False)
+        image.write(os.urandom(2048))
+        image.close()
+        self.addCleanup(os.unlink, image.name)
+        self.image_path = image.name
+
+        fraud_response = AIMessage(content=orjson.dumps({
+            "score": 10,
+            "risk_level": "LOW",
+            "flags": [],
+            "explanation": "Looks normal",
+            "requires_manual_review": False,
+        }).decode())
+        for patcher in (
+            mock.patch.object(nodes.fraud_checker, "submit", mock.AsyncMock(return_value=fraud_response)),
+            mock.patch.object(nodes.fraud_cache, "get", return_value=None),
+            mock.patch.object(nodes.fraud_cache, "set"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_each_audit_note_is_recorded_once(self):
+        graph = build_receipt_processing_graph()
+        state = create_initial_state("receipt-1", self.image_path, "report-1")
+
+        result = asyncio.run(graph.ainvoke(state, {"configurable": {"thread_id": "receipt-1"}}))
+
+        self.assertEqual(result["validation_errors"], [])
+        self.assertEqual(result["audit_notes"], [
+            "Image loaded successfully (2.0 KB)",
+            "Extraction complete: Sample Coffee Shop",
+            "Total: USD 11.34",
+            "Validation passed",
+            "Fraud score: 10/100",
+            "Risk level: LOW",
+            "PROCESSING COMPLETE",
+            "Merchant: Sample Coffee Shop",
+            "Total: USD 11.34",
+        ])
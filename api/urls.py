@@ -1,9 +1,16 @@
 """URL configuration for expense management API."""
 
+from django.http import JsonResponse
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import ExpenseReportViewSet, ReceiptViewSet
 
+
+def health_check(request):
+    """Liveness probe for load balancers."""
+    return JsonResponse({'status': 'ok'})
+
+
 # Create router and register viewsets
 router = DefaultRouter()
 router.register(r'reports', ExpenseReportViewSet, basename='report')
@@ -11,11 +18,7 @@ router.register(r'receipts', ReceiptViewSet, basename='receipt')
 
 urlpatterns = [
     # Health check endpoint
-    path(
-        'health/',
-        lambda request: __import__('django.http', fromlist=['JsonResponse']).JsonResponse({'status': 'ok'}),
-        name='health-check'
-    ),
+    path('health/', health_check, name='health-check'),
     # Include all router-generated URLs
     path('', include(router.urls)),
 ]
@@ -1,27 +1,98 @@
 """Views for expense management API."""
 
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 
 from .models import ExpenseReport, Receipt
 from .serializers import (
+    MAX_IMAGE_SIZE,
     ExpenseReportSerializer,
     ReceiptSerializer,
     ReceiptUploadSerializer,
 )
 
 
-class ExpenseReportViewSet(viewsets.ModelViewSet):
+# Allowance for multipart boundaries and the other form fields
+MAX_UPLOAD_SIZE = MAX_IMAGE_SIZE + 64 * 1024
+
+
+class UploadTooLarge(APIException):
+    """Raised when a request body is larger than any valid receipt upload."""
+    
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Upload too large. Maximum image size is 10MB.'
+    default_code = 'upload_too_large'
+
+
+class ReportPagination(PageNumberPagination):
+    """Page size for report listings; clients may ask for up to 200 per page."""
+    
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class ConditionalListMixin:
+    """Answer repeat list requests with 304 Not Modified when nothing changed.
+    
+    The ETag combines a distinct count of each relation in ``etag_count_fields``
+    with the newest timestamp among ``last_modified_fields``, so deletions
+    invalidate it too. No Last-Modified header is sent: a timestamp alone
+    can't reflect deletions, so If-Modified-Since would serve stale lists.
+    Rows written with ``update()`` must set ``updated_at`` themselves.
+    """
+    
+    etag_count_fields = ('pk',)
+    last_modified_fields = ('updated_at',)
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        stats = queryset.aggregate(
+            **{f'count_{i}': Count(field, distinct=True) for i, field in enumerate(self.etag_count_fields)},
+            **{f'latest_{i}': Max(field) for i, field in enumerate(self.last_modified_fields)},
+        )
+        counts = [stats[f'count_{i}'] for i in range(len(self.etag_count_fields))]
+        latest = max(
+            (stats[f'latest_{i}'] for i in range(len(self.last_modified_fields))
+             if stats[f'latest_{i}'] is not None),
+            default=None,
+        )
+        etag = quote_etag('-'.join(map(str, [*counts, latest.timestamp() if latest else 0])))
+        
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+        
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
+
+class ExpenseReportViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     """ViewSet for managing expense reports."""
     
-    queryset = ExpenseReport.objects.all().order_by('-created_at')
+    # Nested receipts are fetched in one extra query instead of one per report
+    queryset = ExpenseReport.objects.prefetch_related(
+        Prefetch('receipts', queryset=Receipt.objects.order_by('-created_at'))
+    ).order_by('-created_at')
     serializer_class = ExpenseReportSerializer
+    # Reports are rendered with their receipts, so receipt edits and deletions count too
+    etag_count_fields = ('pk', 'receipts')
+    last_modified_fields = ('updated_at', 'receipts__updated_at')
     
     def get_queryset(self):
         """Filter reports by status if provided."""
-        queryset = ExpenseReport.objects.all().order_by('-created_at')
+        queryset = super().get_queryset()
         status_filter = self.request.query_params.get('status', None)
         
         if status_filter:
@@ -29,50 +100,70 @@ class ExpenseReportViewSet(viewsets.ModelViewSet):
         
         return queryset
     
-    @action(detail=True, methods=['post'])
-    def approve(self, request, pk=None):
-        """Approve an expense report."""
+    def _update_status(self, pk, new_status):
+        """Set a report's status with one targeted UPDATE and return it serialized."""
+        # get_object() runs the object permission checks before anything is written
         report = self.get_object()
-        report.status = 'APPROVED'
-        report.save()
+        
+        report.status = new_status
+        report.updated_at = timezone.now()
+        ExpenseReport.objects.filter(pk=report.pk).update(status=report.status, updated_at=report.updated_at)
         
         serializer = self.get_serializer(report)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['post'])
+    def approve(self, request, pk=None):
+        """Approve an expense report."""
+        return self._update_status(pk, 'APPROVED')
+    
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
         """Reject an expense report."""
-        report = self.get_object()
-        report.status = 'REJECTED'
-        report.save()
-        
-        serializer = self.get_serializer(report)
-        return Response(serializer.data)
+        return self._update_status(pk, 'REJECTED')
     
     @action(detail=True, methods=['post'], url_path='flag')
     def flag_for_review(self, request, pk=None):
         """Flag a report for manual review."""
-        report = self.get_object()
-        report.status = 'FLAGGED'
-        report.save()
-        
-        serializer = self.get_serializer(report)
-        return Response(serializer.data)
+        return self._update_status(pk, 'FLAGGED')
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], pagination_class=ReportPagination)
     def pending(self, request):
         """Get all pending reports."""
-        pending_reports = self.get_queryset().filter(status='PENDING')
+        # Skips only this viewset's ?status= filter (it would conflict); any
+        # scoping added to the base get_queryset() still applies
+        pending_reports = viewsets.ModelViewSet.get_queryset(self).filter(status='PENDING')
+        
+        page = self.paginate_queryset(pending_reports)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
         serializer = self.get_serializer(pending_reports, many=True)
         return Response(serializer.data)
 
 
-class ReceiptViewSet(viewsets.ModelViewSet):
+class ReceiptViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     """ViewSet for managing receipts with file upload support."""
     
     queryset = Receipt.objects.all().order_by('-created_at')
     parser_classes = (MultiPartParser, FormParser)
     
+    def initial(self, request, *args, **kwargs):
+        """Reject oversized uploads from Content-Length before the body is parsed."""
+        # Checked before authentication: SessionAuthentication's CSRF check
+        # reads request.POST, which would parse the whole upload first
+        if request.method in ('POST', 'PUT', 'PATCH'):
+            try:
+                content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                content_length = 0
+            
+            if content_length > MAX_UPLOAD_SIZE:
+                raise UploadTooLarge()
+        
+        super().initial(request, *args, **kwargs)
+    
     def get_serializer_class(self):
         """Return appropriate serializer based on action."""
         if self.action in ['create', 'update', 'partial_update']:
@@ -81,7 +172,7 @@ class ReceiptViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter receipts by report ID if provided."""
-        queryset = Receipt.objects.all().order_by('-created_at')
+        queryset = super().get_queryset()
         report_id = self.request.query_params.get('report', None)
         
         if report_id:
@@ -93,10 +184,11 @@ class ReceiptViewSet(viewsets.ModelViewSet):
         """Create receipt and trigger AI processing."""
         receipt = serializer.save()
         
-        # Trigger async AI processing
+        # Trigger async AI processing once the row is committed, so the
+        # worker can never start before the receipt is visible to it
         from .tasks import process_receipt_task
-        task_result = process_receipt_task.delay(str(receipt.id))
+        transaction.on_commit(lambda receipt_id=str(receipt.id): process_receipt_task.delay(receipt_id))
         
-        print(f"Receipt created: {receipt.id}, AI task: {task_result.id}")
+        print(f"Receipt created: {receipt.id}, AI task queued on commit")
         
         return receipt
@@ -51,9 +51,11 @@ app.conf.update(
     # -----------------------------------------------------------------
     # SERIALIZATION
     # -----------------------------------------------------------------
-    task_serializer='json',      # Use JSON to serialize tasks
-    accept_content=['json'],     # Only accept JSON
-    result_serializer='json',    # Use JSON for results
+    task_serializer='msgpack',   # Use msgpack to serialize tasks
+    accept_content=['msgpack', 'json'],  # Still accept JSON (in-flight messages)
+    result_serializer='msgpack', # Use msgpack for results
+    # ↑ msgpack is a binary JSON: smaller messages and a C codec, which
+    #   adds up when a rescan or batch publishes thousands of tasks
     
     # -----------------------------------------------------------------
     # TIMEZONE
@@ -67,6 +69,10 @@ app.conf.update(
     task_track_started=True,     # Track when tasks start
     task_time_limit=600,         # Hard limit: 10 minutes
     task_soft_time_limit=540,    # Soft limit: 9 minutes
+    task_acks_late=True,         # Ack after the task finishes, not on receipt
+    task_reject_on_worker_lost=True,  # Requeue if the worker process dies
+    # ↑ Together these mean a worker holds at most the task it is running:
+    #   nothing sits reserved behind a 5-minute AI job on a busy worker
     
     # -----------------------------------------------------------------
     # WORKER SETTINGS
@@ -74,6 +80,33 @@ app.conf.update(
     worker_prefetch_multiplier=1,  # One task at a time
     # ↑ For AI tasks, we don't want workers grabbing too many
     #   Each task uses lots of memory/GPU
+    worker_disable_rate_limits=True,  # No task uses rate_limit; skip the bookkeeping
+    
+    # -----------------------------------------------------------------
+    # QUEUES & ROUTING
+    # -----------------------------------------------------------------
+    task_default_queue='default',
+    task_routes={
+        'api.tasks.process_receipt_task': {'queue': 'ai'},
+        'api.tasks.rescan_recent_receipts_for_fraud': {'queue': 'periodic'},
+    },
+    # ↑ Slow AI jobs get their own workers, so a big rescan or a batch
+    #   of uploads never sits in front of quick tasks (and vice versa)
+    
+    # -----------------------------------------------------------------
+    # CONNECTIONS
+    # -----------------------------------------------------------------
+    broker_pool_limit=100,       # Producer connections (default: 10)
+    # ↑ Views and dispatching tasks publish concurrently; a small pool
+    #   makes them wait on each other for a connection
+    broker_transport_options={
+        'socket_keepalive': True,      # Keep idle connections open
+        'health_check_interval': 30,   # Ping idle connections every 30s
+    },
+    result_backend_transport_options={
+        'socket_keepalive': True,
+        'retry_on_timeout': True,      # Retry a timed-out Redis call once
+    },
     
     # -----------------------------------------------------------------
     # RESULT BACKEND
@@ -106,14 +139,23 @@ def debug_task(self):
 # 1. Start Redis (the broker):
 #        docker-compose up redis -d
 #
-# 2. Start a Celery worker:
-#        celery -A config worker --loglevel=info
+# 2. Start the Celery workers (one per queue group, see task_routes above):
+#        WARM_AI_PIPELINE=1 celery -A config worker -Ofair -Q ai --loglevel=info --concurrency=2
+#        celery -A config worker -Q default,periodic --loglevel=info --concurrency=8
+#
+#    WARM_AI_PIPELINE=1 builds the AI pipeline as each child starts
+#    (only useful on workers that consume the 'ai' queue)
 #
 #    Options:
 #        -A config: Use config/celery.py
+#        -Ofair: Only hand tasks to idle child processes, so short tasks
+#                don't queue behind a long AI job in a busy child
 #        --loglevel=info: Show info logs
 #        --concurrency=2: Run 2 worker processes
-#        -Q default: Process tasks from 'default' queue
+#        -Q ai: Process tasks from the 'ai' queue
+#
+#    ⚠️ A worker started without -Q only consumes 'default', so
+#       receipts (routed to 'ai') would never be processed
 #
 # 3. (Optional) Start Celery Beat for periodic tasks:
 #        celery -A config beat --loglevel=info
@@ -133,7 +175,20 @@ def debug_task(self):
 #
 #   celery_worker:
 #     build: .
-#     command: celery -A config worker --loglevel=info
+#     command: celery -A config worker -Ofair -Q ai --loglevel=info --concurrency=2
+#     volumes:
+#       - .:/app
+#     env_file:
+#       - .env
+#     environment:
+#       - WARM_AI_PIPELINE=1
+#     depends_on:
+#       - db
+#       - redis
+#
+#   celery_worker_light:
+#     build: .
+#     command: celery -A config worker -Q default,periodic --loglevel=info --concurrency=8
 #     volumes:
 #       - .:/app
 #     env_file: